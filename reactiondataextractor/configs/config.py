@@ -63,6 +63,9 @@ class ProcessorConfig(Config):
     # Image binarisation thresholds
     BIN_THRESH = [70, 255]
     CANNY_THRESH = [50, 100]
+    # Number of threads used by OpenCV routines, applied when SchemeExtractor.extract starts (set to 1 when running
+    # extraction inside your own thread/process pool)
+    OPENCV_NUM_THREADS = os.cpu_count() or 1
 
 
 class OCRConfig(Config):
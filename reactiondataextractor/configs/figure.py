@@ -1,6 +1,8 @@
 class GlobalFigureMixin:
     """If no `figure` was passed to an initializer, use the figure stored in configs
     (set at the beginning of extraction)"""
+    __slots__ = ()
+
     def __init__(self, fig):
         if fig is None:
             import reactiondataextractor.configs.config
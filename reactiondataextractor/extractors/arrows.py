@@ -22,7 +22,7 @@ from torch import load, device, nn
 from reactiondataextractor.configs import ExtractorConfig, Config
 from reactiondataextractor.models.base import BaseExtractor
 from reactiondataextractor.models.exceptions import NoArrowsFoundException
-from reactiondataextractor.models.segments import FigureRoleEnum, Panel, Figure, Crop
+from reactiondataextractor.models.segments import FigureRoleEnum, Panel, Figure, Crop, Rect
 from reactiondataextractor.models.reaction import SolidArrow, CurlyArrow, EquilibriumArrow, ResonanceArrow, BaseArrow
 from reactiondataextractor.processors import Isolator
 
@@ -99,9 +99,11 @@ class ArrowExtractor(BaseExtractor):
            """
         len_ccs = len(self.fig.connected_components)
         equilibrium_arrow_cands = []
+        cc_coords = Rect.stack_coords(self.fig.connected_components)
         for idx1 in range(len_ccs-1):
             cc1 = self.fig.connected_components[idx1]
-            closest = min(self.fig.connected_components[idx1+1:], key=lambda cc2: cc1.center_separation(cc2))
+            dists = Rect.pairwise_center_separation(cc_coords[idx1:idx1+1], cc_coords[idx1+1:])[0]
+            closest = self.fig.connected_components[idx1 + 1 + int(dists.argmin())]
             if cc1.edge_separation(closest) < 40:
                 candidate = Panel.create_megapanel([cc1,closest], fig=cc1.fig)
                 equilibrium_arrow_cands.append(candidate)
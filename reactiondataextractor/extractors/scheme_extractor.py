@@ -11,10 +11,11 @@ email: dmw51@cam.ac.uk
 """
 from pathlib import Path
 
+import cv2
 import matplotlib.pyplot as plt
 
 from reactiondataextractor.utils.vectorised import estimate_single_bond
-from reactiondataextractor.configs.config import Config
+from reactiondataextractor.configs.config import Config, ProcessorConfig
 from reactiondataextractor.extractors.arrows import ArrowExtractor
 from reactiondataextractor.extractors.unified import UnifiedExtractor
 
@@ -23,7 +24,7 @@ from reactiondataextractor.extractors.smiles import SmilesExtractor
 from reactiondataextractor.models.base import BaseExtractor
 from reactiondataextractor.models.exceptions import NoArrowsFoundException, NoDiagramsFoundException
 from reactiondataextractor.models.output import ReactionScheme, RoleProbe
-from reactiondataextractor.processors import ImageReader, ImageScaler, ImageNormaliser, Binariser
+from reactiondataextractor.processors import ImageReader, ImageScaler, Binariser
 from reactiondataextractor.recognise import DecimerRecogniser
 
 
@@ -58,6 +59,7 @@ class SchemeExtractor(BaseExtractor):
 
     def extract(self):
         """The main extraction method. Allows extraction from single image or a directory using a single interface. """
+        cv2.setNumThreads(ProcessorConfig.OPENCV_NUM_THREADS)
         if not self._extract_single_image:
             return self.extract_from_dir()
         else:
@@ -90,10 +92,7 @@ class SchemeExtractor(BaseExtractor):
         fig = reader.process()
         scaler = ImageScaler(fig, resize_min_dim_to=1024)#, enabled=True)
         fig = scaler.process()
-        normaliser = ImageNormaliser(fig)
-        fig = normaliser.process()
-
-        binarizer = Binariser(fig)
+        binarizer = Binariser(fig, normalise=True)  # Normalisation is fused with thresholding
         fig = binarizer.process()
         Config.FIGURE = fig
         self._fig = fig
@@ -334,7 +334,7 @@ class UnifiedExtractor(BaseExtractor):
         :type panels: list[Panel]
         :return: filtered, unique panels
         :rtype: list[Panel]"""
-        dists = np.array([[p1.edge_separation(p2) for p1 in panels] for p2 in panels])
+        dists = Rect.pairwise_edge_separation(panels, panels)
         not_yet_grouped = set(list(range(len(panels))))
         if len(not_yet_grouped) == 1:
             return panels
@@ -401,11 +401,10 @@ class UnifiedExtractor(BaseExtractor):
         :return: filtered, unique diagrams
         :rtype: list[Diagram]
         """
-        filtered_diags = []
-        for diag in diag_priors:
-            is_diag = diag is not None
-            if is_diag and all(diag.compute_iou(arrow) < ExtractorConfig.UNIFIED_DIAG_FP_IOU_THRESH for arrow in self.all_arrows):
-                filtered_diags.append(diag)
+        diag_priors = [diag for diag in diag_priors if diag is not None]
+        ious = Rect.iou_matrix(diag_priors, self.all_arrows)  # Rows - diagrams, columns - arrows
+        filtered_diags = [diag for diag, diag_ious in zip(diag_priors, ious)
+                          if (diag_ious < ExtractorConfig.UNIFIED_DIAG_FP_IOU_THRESH).all()]
 
         return filtered_diags
 
@@ -634,14 +633,10 @@ class DiagramExtractor(BaseExtractor):
         self._assign_diagram_parts(structure_panels, other_ccs)  # Assigns cc roles
         
         # simple filtering to account for potential multiple priors corresponding to the same diagram
-        duplicated = []
-        for idx_to_remove, panel1 in enumerate(structure_panels):
-            for panel2 in structure_panels:
-                if panel2.contains(panel1) and panel2 != panel1:
-                    duplicated.append(idx_to_remove)
-
-        duplicated = set(duplicated)
-        unique = [structure_panels[idx]  for idx in range(len(structure_panels)) if idx not in duplicated]
+        coords = Rect.stack_coords(structure_panels)
+        identical = np.all(coords[:, None, :] == coords[None, :, :], axis=2)
+        duplicated = np.any(Rect.contains_matrix(coords, coords) & ~identical, axis=0)
+        unique = [panel for panel, is_duplicated in zip(structure_panels, duplicated) if not is_duplicated]
 
         return list(set(unique))
 
@@ -672,7 +667,7 @@ class DiagramExtractor(BaseExtractor):
                 dilated_figs[num_iterations] = dilated_temp
 
             # try:
-            corresponding_panels_in_dilated_fig = [cc for cc in dilated_temp.connected_components if cc.contains(diag)]
+            corresponding_panels_in_dilated_fig = dilated_temp.find_ccs_containing(diag)
             if len(corresponding_panels_in_dilated_fig) > 0:
                 dilated_structure_panel = min(corresponding_panels_in_dilated_fig, key=lambda panel: panel.area)
             else:
@@ -703,18 +698,16 @@ class DiagramExtractor(BaseExtractor):
         fig = self.fig
 
         for parent_panel in structure_panels:
-            for cc in fig.connected_components:
-                if parent_panel.contains(cc):  # Set the parent panel for all
-                    setattr(cc, 'parent_panel', parent_panel)
-                    if cc.role != FigureRoleEnum.DIAGRAMPRIOR:
-                        # Set role for all except backbone which had been set
-                        setattr(cc, 'role', FigureRoleEnum.DIAGRAMPART)
+            for cc in fig.find_ccs_within(parent_panel):  # Set the parent panel for all
+                setattr(cc, 'parent_panel', parent_panel)
+                if cc.role != FigureRoleEnum.DIAGRAMPRIOR:
+                    # Set role for all except backbone which had been set
+                    setattr(cc, 'role', FigureRoleEnum.DIAGRAMPART)
 
         for cc in cno_ccs:
             # ``cno_ccs`` are dilated - find raw ccs in ``fig``
-            fig_ccs = [fig_cc for fig_cc in fig.connected_components if cc.contains(fig_cc)]
-
-            [setattr(fig_cc, 'role', None) for fig_cc in fig_ccs]
+            for fig_cc in fig.find_ccs_within(cc):
+                fig_cc.role = None
 
 
     def _complete_structures(self, dilated_structure_panels: List[Panel]) -> List[Panel]:
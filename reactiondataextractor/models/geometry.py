@@ -36,7 +36,7 @@ class Point:
 
         drow = self.row - other.row
         dcol = self.col - other.col
-        return np.hypot(drow, dcol)
+        return math.hypot(drow, dcol)
 
 
 class Line:
@@ -120,7 +120,7 @@ class Line:
         x0, y0 = other.col, other.row
 
         top = abs((y2-y1)*x0 - (x2-x1)*y0 + x2*y1-y2*x1)
-        bottom = np.sqrt((y2-y1)**2+(x2-x1)**2)
+        bottom = math.hypot(y2-y1, x2-x1)
 
         return top/bottom
 
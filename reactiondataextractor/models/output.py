@@ -9,16 +9,15 @@ author: Damian Wilary
 email: dmw51@cam.ac.uk
 
 """
-import copy
 from abc import ABC, abstractmethod
-from collections import Counter, namedtuple
+from collections import Counter, deque, namedtuple
 from collections.abc import Iterable
+import math
 import numpy as np
 import json
 from typing import List, Tuple, Union
 
 import cv2
-from sklearn.cluster import DBSCAN
 
 from reactiondataextractor.models.exceptions import SchemeReconstructionFailedException
 from reactiondataextractor.models.geometry import Line
@@ -28,6 +27,57 @@ from reactiondataextractor.configs.config import SchemeConfig
 from reactiondataextractor.utils.utils import find_points_on_line, euclidean_distance, skeletonize
 
 ConditionsPlaceholder = namedtuple('ConditionsPlaceholder', ['panel', 'text', 'conditions_dct'])
+
+
+def panel_bboxes(panels):
+    """Stacks coordinates of all panels into a single (N, 4) array with rows (left, top, right, bottom)
+
+    :param panels: panels (or objects exposing panel coordinates)
+    :type panels: list[Panel]
+    :return: array of panel coordinates
+    :rtype: np.ndarray"""
+    return np.array([[p.left, p.top, p.right, p.bottom] for p in panels], dtype=np.float32).reshape(-1, 4)
+
+
+def edge_separations(panels, points):
+    """Computes edge separations between all panels and all points in a single broadcast operation. Equivalent to
+    calling `panel.edge_separation(point)` for every (panel, point) pair
+
+    :param panels: panels (or objects exposing panel coordinates) to which the distances are computed, or their
+    precomputed coordinates as returned by `panel_bboxes`
+    :type panels: list[Panel]|np.ndarray
+    :param points: (x, y) points from which the distances are computed
+    :type points: list[tuple[float, float]]
+    :return: array of shape (len(panels), len(points)) containing all distances
+    :rtype: np.ndarray"""
+    bboxes = panels if isinstance(panels, np.ndarray) else panel_bboxes(panels)
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    dx = np.maximum(bboxes[:, 0:1] - points[:, 0], 0) + np.maximum(points[:, 0] - bboxes[:, 2:3], 0)
+    dy = np.maximum(bboxes[:, 1:2] - points[:, 1], 0) + np.maximum(points[:, 1] - bboxes[:, 3:4], 0)
+    return np.hypot(dx, dy)
+
+
+def _cluster_1d(xs, eps, min_samples=2):
+    """Clusters scalar values by splitting the sorted values wherever two consecutive ones are more than `eps` apart.
+
+    This is what DBSCAN reduces to in one dimension. Points in clusters smaller than `min_samples` are labelled -1
+    :param xs: values to cluster
+    :type xs: np.ndarray
+    :param eps: maximum gap between two consecutive values of the same cluster
+    :type eps: float
+    :param min_samples: minimum cluster size; smaller clusters are treated as outliers
+    :type min_samples: int
+    :return: cluster label of each value
+    :rtype: np.ndarray"""
+    order = np.argsort(xs, kind='stable')
+    gaps = np.diff(xs[order]) > eps
+    labels = np.empty(len(xs), dtype=int)
+    labels[order] = np.concatenate([[0], np.cumsum(gaps)])
+    counts = np.bincount(labels)
+    labels[counts[labels] < min_samples] = -1
+    return labels
+
+
 class Graph(ABC):
     """Generic directed graph class
     """
@@ -35,11 +85,17 @@ class Graph(ABC):
     def __init__(self):
         """:param nodes: a mapping from node index to contents of the node
         :type graph_dict: dict
-        :param adjacency: a dict with a key for each node index with outgoing connections and a value specifying all connections from this node
-        :param adjacency: dict"""
+        :param _indptr: CSR-style offsets into `_indices`; successors of node u are `_indices[_indptr[u]:_indptr[u+1]]`
+        :type _indptr: np.ndarray
+        :param _indices: CSR-style array of successor indices of all nodes, grouped by the source node
+        :type _indices: np.ndarray"""
         self.nodes = {}
-        self.adjacency = {}
         self._node_idx = 0
+        self._idx_to_node = None
+        self._edges_tmp = []
+        self._fs_cache = {}
+        self._indptr = np.zeros(1, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
 
     @abstractmethod
     def _generate_edge(self, *args):
@@ -62,37 +118,96 @@ class Graph(ABC):
         A graph needs to have a __str__ method to constitute a valid output representation.
         """
 
+    def _fs(self, group):
+        """Returns `group` as a frozenset. The frozenset is computed (and its elements hashed) only once per group
+        object. The group itself is stored alongside so that its id cannot be reused while cached"""
+        cached = self._fs_cache.get(id(group))
+        if cached is None:
+            cached = (group, frozenset(group))
+            self._fs_cache[id(group)] = cached
+        return cached[1]
+
     def add_node(self, node):
-        if frozenset(node) not in self.nodes:
-            self.nodes[frozenset(node)] = self._node_idx
+        node_fs = self._fs(node)
+        if node_fs not in self.nodes:
+            self.nodes[node_fs] = self._node_idx
             self._node_idx += 1
+            self._idx_to_node = None
+
+    def _build_adjacency(self):
+        """Compresses all (source, destination) pairs accumulated in `_edges_tmp` into the `_indptr` and `_indices`
+        arrays. Should be called once, after all edges have been generated"""
+        edges = np.asarray(self._edges_tmp, dtype=np.int32).reshape(-1, 2)
+        edges = edges[np.argsort(edges[:, 0], kind='stable')]
+        counts = np.bincount(edges[:, 0], minlength=len(self.nodes))
+        self._indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int32)
+        self._indices = np.ascontiguousarray(edges[:, 1])
+        self._edges_tmp = []
+
+    def neighbors(self, u):
+        """Returns indices of all successors of node with index `u`"""
+        if u + 1 >= len(self._indptr):
+            return self._indices[:0]
+        return self._indices[self._indptr[u]:self._indptr[u+1]]
+
+    @property
+    def adjacency(self):
+        """A dict with a key for each node index with outgoing connections and a value specifying all connections
+        from this node"""
+        return {u: self.neighbors(u).tolist() for u in range(len(self._indptr) - 1)
+                if self._indptr[u+1] > self._indptr[u]}
+
+    @property
+    def idx_to_node(self):
+        """Inverse of the `nodes` mapping - a list, where the i-th element holds the contents of node with index i.
+        Computed once and cached until a new node is added"""
+        if self._idx_to_node is None:
+            idx_to_node = [None] * len(self.nodes)
+            for node, idx in self.nodes.items():
+                idx_to_node[idx] = node
+            self._idx_to_node = idx_to_node
+        return self._idx_to_node
 
     def find_isolated_vertices(self):
         """
         Returns all isolated vertices. Can be used for output validation
         :return: collection of isolated (unconnected) vertices
         """
-        nodes_indices = set(self.nodes.keys())
+        num_nodes = len(self.nodes)
+        out_degree = np.zeros(num_nodes, dtype=np.int32)
+        out_degree[:len(self._indptr) - 1] = np.diff(self._indptr)
+        in_degree = np.bincount(self._indices, minlength=num_nodes)
 
         # Isolated means no outgoing edges and no incoming edges
-        no_out_nodes = set(nodes_indices.difference(set(self.adjacency.keys())))
-        all_incoming_connections = set([v for connections in self.adjacency.values() for v in connections])
-        unconnected = no_out_nodes.difference(all_incoming_connections)
-        return unconnected
-
-    def find_path(self, node1, node2, path=None):
-        #TODO: Refactor this to match the new graph definition
-        if path is None:
-            path = []
-        path += [node1]
-        graph = self._graph_dict
-        if node1 not in graph:
+        unconnected = np.flatnonzero((out_degree == 0) & (in_degree == 0))
+        return {self.idx_to_node[idx] for idx in unconnected}
+
+    def find_path(self, node1, node2):
+        """Finds the shortest path between `node1` and `node2` using an iterative breadth-first search.
+
+        :param node1: contents of the start node
+        :param node2: contents of the end node
+        :return: contents of all nodes along the path (including `node1` and `node2`), or None if no path exists
+        :rtype: list[frozenset]|None"""
+        start, end = self.nodes.get(self._fs(node1)), self.nodes.get(self._fs(node2))
+        if start is None or end is None:
             return None
-        if node2 in graph[node1]:
-            return path + [node2]
-        else:
-            for value in graph[node1]:
-                return self.find_path(value, node2, path)
+
+        predecessors = {start: None}
+        queue = deque([start])
+        while queue:
+            u = queue.popleft()
+            if u == end:
+                path = []
+                while u is not None:
+                    path.append(self.idx_to_node[u])
+                    u = predecessors[u]
+                return path[::-1]
+            for v in self.neighbors(u).tolist():
+                if v not in predecessors:
+                    predecessors[v] = u
+                    queue.append(v)
+        return None
 
 
 class ReactionScheme(Graph):
@@ -118,19 +233,15 @@ class ReactionScheme(Graph):
         return self.adjacency
 
     def _generate_edge(self, key, successor):
-        key = self.nodes[frozenset(key)]
-        successor = self.nodes[frozenset(successor)]
-
-        if self.adjacency.get(key):
-            self.adjacency[key].append(successor)
-        else:
-            self.adjacency[key] = [successor]
+        key = self.nodes[self._fs(key)]
+        successor = self.nodes[self._fs(successor)]
+        self._edges_tmp.append((key, successor))
 
     def __repr__(self):
-        return f'ReactionScheme({self._reaction_steps})'
+        return f'ReactionScheme({self._reaction_steps!r})'
 
     def __str__(self):
-        return '\n'.join([str(reaction_step) for reaction_step in self._reaction_steps])
+        return '\n'.join(map(str, self._reaction_steps))
 
     def __iter__(self):
         return self
@@ -140,9 +251,11 @@ class ReactionScheme(Graph):
         pass
 
     def add_node(self, node):
-        if frozenset(node) not in self.nodes:
-            self.nodes[frozenset(node)] = self._node_idx
+        node_fs = self._fs(node)
+        if node_fs not in self.nodes:
+            self.nodes[node_fs] = self._node_idx
             self._node_idx += 1
+            self._idx_to_node = None
             if isinstance(node, Iterable):
                 for elem in node:
                     if isinstance(elem, Diagram):
@@ -155,11 +268,11 @@ class ReactionScheme(Graph):
 
     @property
     def reactants(self):
-        return self._start # FIXME there is now _start attribute
+        return self._start
 
     @property
     def products(self):
-        return self._end # FIXME there is now _end attribute
+        return self._end
 
     def long_str(self):
         """Longer str method - contains more information (eg conditions)"""
@@ -171,39 +284,39 @@ class ReactionScheme(Graph):
         :return: completed graph dictionary
         """
 
-        for step in self._reaction_steps:
-            conditions = step.conditions if step.conditions != [] else [ConditionsPlaceholder(panel=step.arrow.panel, text='', conditions_dct=None)]
+        steps_conditions = [step.conditions if step.conditions != [] else
+                            [ConditionsPlaceholder(panel=step.arrow.panel, text='', conditions_dct=None)]
+                            for step in self._reaction_steps]
+        for step, conditions in zip(self._reaction_steps, steps_conditions):
             self.add_node(step.reactants)
             self.add_node(conditions)
             self.add_node(step.products)
 
 
-        for step in self._reaction_steps:
-            conditions = step.conditions if step.conditions != [] else [ConditionsPlaceholder(panel=step.arrow.panel, text='', conditions_dct=None)]
+        for step, conditions in zip(self._reaction_steps, steps_conditions):
             self._generate_edge(step.reactants, conditions)
             self._generate_edge(conditions, step.products)
+        self._build_adjacency()
+        self.set_start_end_nodes()
 
-    def find_path(self, group1, group2, path=None):
-        """ Recursive routine for simple path finding between reactants and products"""
-        graph = self._graph_dict
-        if path is None:
-            path = []
-        path += [group1]
-        if group1 not in graph:
-            return None
+    def set_start_end_nodes(self):
+        """
+        Finds the start and end nodes of the scheme in a single pass over all reaction steps. Start nodes are the
+        species groups which appear only as step reactants, whereas end nodes are the groups which appear only as step
+        products
+        """
+        sides = {}
+        for step in self._reaction_steps:
+            for group, side in ((step.reactants, 'r'), (step.products, 'p')):
+                sides.setdefault(self._fs(group), set()).add(side)
 
-        successors = graph[group1]
-        if group2 in successors:
-            return path+[group2]
-        else:
-            for prod in successors:
-                return self.find_path(prod, group2, path=path)
-        return None
+        self._start = [group for group, group_sides in sides.items() if group_sides == {'r'}]
+        self._end = [group for group, group_sides in sides.items() if group_sides == {'p'}]
 
     def to_json(self):
         adjacency = self.adjacency
         nodes = []
-        for node, value in self.nodes.items():
+        for node in self.idx_to_node:  # position in the list corresponds to the node index used in `adjacency`
             node_dcts = []
             for element in node:
                 if isinstance(element, Diagram):  # Either a Diagram or Conditions
@@ -237,25 +350,67 @@ class RoleProbe:
         self.arrows = arrows
         probed_diags = self.remove_reaction_conditions_diags(diagrams)
         self.diagrams = probed_diags
-        # FIXME: ValueError: min() arg is an empty sequence
-        self.stepsize = min([x for diag in self.diagrams for x in (diag.panel.width, diag.panel.height)]) * 0.2 #Step size should be related to width/height of the smallest diagram, whichever is smaller
+        # FIXME: ValueError: zero-size array to reduction operation minimum which has no identity
+        self.stepsize = self._panel_dims.min() * 0.2 #Step size should be related to width/height of the smallest diagram, whichever is smaller
         # Could also be a function depending on arrow direction, but might not be necessary
-        self.segment_length = np.mean([(d.panel.width + d.panel.height) / 2 for d in self.diagrams]) // 2
+        self.segment_length = self._panel_dims.mean() // 2
         # This should be comparable to the largest dim of the largest diagrams, but might not be
                                 # stable to outliers
         self.reaction_steps = []
         self.is_incomplete = False
 
+    @property
+    def arrows(self):
+        return self._arrows
+
+    @arrows.setter
+    def arrows(self, arrows):
+        self._arrows = arrows
+        self._refresh_arrow_cache()
+
+    @property
+    def diagrams(self):
+        return self._diagrams
+
+    @diagrams.setter
+    def diagrams(self, diagrams):
+        self._diagrams = diagrams
+        self._refresh_panel_cache()
+
+    def _refresh_panel_cache(self):
+        """Stores coordinates and dimensions of diagram panels contiguously for vectorised distance computations.
+        Called by the `diagrams` setter"""
+        self._diag_bb = panel_bboxes(self.diagrams)
+        self._diag_center = 0.5 * (self._diag_bb[:, :2] + self._diag_bb[:, 2:])
+        self._panel_dims = np.array([[d.panel.width, d.panel.height] for d in self.diagrams],
+                                    dtype=np.int32).reshape(-1, 2)
+
+    def _refresh_arrow_cache(self):
+        """Stores coordinates and dimensions of arrow panels contiguously, in the order of `self.arrows`. Called by the
+        `arrows` setter"""
+        self._arrow_bb = panel_bboxes(self.arrows)
+        self._arrow_max_dims = np.array([max(a.panel.width, a.panel.height) for a in self.arrows], dtype=float)
+        # Indices of all the remaining arrows, used when checking whether a scan runs into another arrow
+        self._others_by_arrow = {id(a): np.array([idx for idx, b in enumerate(self.arrows) if b is not a], dtype=int)
+                                 for a in self.arrows}
+
+    def _other_arrow_idx(self, arrow):
+        """Returns indices of all arrows in `self.arrows` other than `arrow`, which itself need not be in `self.arrows`"""
+        other_idx = self._others_by_arrow.get(id(arrow))
+        if other_idx is None:
+            other_idx = np.array([idx for idx, a in enumerate(self.arrows) if a is not arrow], dtype=int)
+        return other_idx
+
     def remove_reaction_conditions_diags(self, diags):
-        cond_diags = []
+        cond_diags = set()
         for arrow in self.arrows:
             for child in arrow.children:
                 if isinstance(child, Diagram):
-                    cond_diags.append(child)
+                    cond_diags.add(child)
                 elif isinstance(child, Conditions):
                     if child.diags:
-                        cond_diags.extend(child.diags)
-        return [diag for diag in diags if diag not in cond_diags]  
+                        cond_diags.update(child.diags)
+        return [diag for diag in diags if diag not in cond_diags]
 
     def probe(self):
         unique_arrows = []
@@ -268,7 +423,8 @@ class RoleProbe:
             unique_arrows.append(arrow_cluster)
         arrows = [c[0] for c in unique_arrows]
         self.arrows = list(set(arrows))
-        [self.probe_around_arrow(a) for a in self.arrows]
+        for a in self.arrows:
+            self.probe_around_arrow(a)
           
     def probe_around_arrow(self, arrow):
         """Main probing method.
@@ -282,6 +438,7 @@ class RoleProbe:
         :return: an object containing step reactants, products, and the arrow
         :rtype: ReactionStep"""
 
+        other_idx = self._other_arrow_idx(arrow)
         if isinstance(arrow, CurlyArrow):
             single_line = False
             biggest_diag = max(self.diagrams, key=lambda diag: diag.panel.area) # FIXME: ValueError: max() arg is an empty sequence
@@ -291,25 +448,27 @@ class RoleProbe:
             except ValueError:
                 return
             diags_react = self._perform_scan(arrow, scan_region_dims, scan_params[0][0], scan_params[0][1],
-                                                switch=+1)
+                                                switch=+1, other_idx=other_idx)
             diags_prod = self._perform_scan(arrow, scan_region_dims, scan_params[1][0], scan_params[1][1],
-                                                switch=+1)
+                                                switch=+1, other_idx=other_idx)
             
             if not (diags_react and diags_prod):
                 self.is_incomplete = True
                 return
             
         else:
-            x_one, y_one = arrow.center
-            x_two, y_two = self.fig.img.shape[1] - arrow.center[0], self.fig.img.shape[0] - arrow.center[1]
+            img_height, img_width = self.fig.img.shape[:2]
+            arrow_center = arrow.center
+            x_one, y_one = arrow_center
+            x_two, y_two = img_width - x_one, img_height - y_one
 
             region_one_dims = (x_one, y_one)
             regions_two_dims = (x_two, y_two)
             direction, direction_normal = self._compute_arrow_scan_params(arrow)
-            diags_one = self._perform_scan(arrow, region_one_dims, arrow.center, direction,
-                                                switch=-1)
-            diags_two = self._perform_scan(arrow, regions_two_dims, arrow.center, direction,
-                                                switch=+1)
+            diags_one = self._perform_scan(arrow, region_one_dims, arrow_center, direction,
+                                                switch=-1, other_idx=other_idx)
+            diags_two = self._perform_scan(arrow, regions_two_dims, arrow_center, direction,
+                                                switch=+1, other_idx=other_idx)
 
             if diags_one and diags_two:
                 single_line = True
@@ -319,15 +478,16 @@ class RoleProbe:
             else: ### If no diags were found on one side of an arrow, assume, they can be
                 # found in the previous or next row of the reaction
                 # Check whether the arrow is at the beginning or end of a given line
-                closer_extreme = min([0, self.fig.img.shape[1]], key=lambda coord: (arrow.panel.center[0] - coord)**2)
-                search_direction = 'up-right' if closer_extreme == 0 else 'down-left'
+                search_direction = 'up-right' if x_one <= x_two else 'down-left'
                 try:
                     diags_one = diags_one if diags_one else self._search_elsewhere(where=search_direction, arrow=arrow,
                                                                                 direction=direction,
-                                                                                switch=-1)
+                                                                                switch=-1,
+                                                                                other_idx=other_idx)
                     diags_two = diags_two if diags_two else self._search_elsewhere(where=search_direction, arrow=arrow,
                                                                                 direction=direction,
-                                                                                switch=+1)
+                                                                                switch=+1,
+                                                                                other_idx=other_idx)
                     if diags_one and diags_two:
                         diags_react, diags_prod = self.assign_diags(diags_one, diags_two, arrow, multiline=True)
                     
@@ -361,15 +521,14 @@ class RoleProbe:
             """Compute two distances: one between the midpoint and the group of bounding boxes,
             then betwen the reference point (cente of mass of an arrow). Thes subtract the two values.
             The distance in these two scenarios will decrease for the product group, and increase for the reactant group"""
-            dist_center = min(bbox.edge_separation(arrow_center) for bbox in group)
-            dist_ref_point = min(bbox.edge_separation(ref_point) for bbox in group)
+            dist_center, dist_ref_point = edge_separations(group, [arrow_center, ref_point]).min(axis=0)
             return dist_ref_point - dist_center
         
         def compute_arrow_group_dist(group):
             """Compute two distances: one between the midpoint and the group of bounding boxes,
             then betwen the reference point (cente of mass of an arrow). Thes subtract the two values.
             The distance in these two scenarios will decrease for the product group, and increase for the reactant group"""
-            return  min(bbox.edge_separation(arrow_center) for bbox in group)
+            return edge_separations(group, [arrow_center]).min()
         
         if not multiline:
             prod_group = min(groups, key=compute_arrow_group_dist_change)
@@ -403,12 +562,11 @@ class RoleProbe:
         selected_px = [(px[0]+left, px[1]+top) for px in selected_px]
 
         pairs = []
-        for px in selected_px:
-            x, y = px
-            temp_rect = Rect((y,x,y,x)) 
-            closest_diag = min(self.diagrams, key=lambda diag: diag.panel.edge_separation(temp_rect))
-            if closest_diag.panel.edge_separation(temp_rect) < curly_arrow.panel.width * 0.3:
-                pairs.append((px, closest_diag))
+        diag_dists = edge_separations(self._diag_bb, selected_px)  # Rows - diagrams, columns - selected pixels
+        for px, px_dists in zip(selected_px, diag_dists.T):
+            closest_idx = px_dists.argmin()
+            if px_dists[closest_idx] < curly_arrow.panel.width * 0.3:
+                pairs.append((px, self.diagrams[closest_idx]))
                 
         reactant_ends = []
         product_ends = []
@@ -431,9 +589,11 @@ class RoleProbe:
             deltas = np.stack((x_deltas*x_step, x_deltas*y_step), axis=1)
             line_pt = np.stack([x,y], axis=1)
             line_pts = np.concatenate((line_pt - deltas,line_pt,  line_pt + deltas), axis=0)
+            # Endpoints of all the segments normal to the fitted line, computed at once
+            ends_one, ends_two = find_points_on_line(line_pts, direction_normal, distance=10)
             num_pixels = []
-            for pt in line_pts:
-                l = Line(find_points_on_line(pt, direction_normal, distance=10))
+            for end_one, end_two in zip(ends_one, ends_two):
+                l = Line((end_one, end_two))
                 pixels = np.asarray([[p.row, p.col] for p in l.pixels])
                 try:
                     pixels = crop[pixels[:,0], pixels[:,1]]
@@ -462,21 +622,21 @@ class RoleProbe:
             if x2 - x1 == 0:
                 direction = [0, (y2-y1)/np.abs(y2-y1)]
             else:
-                direction = np.asarray([(x2-x1)/np.abs(x2-x1), (x2-x1)/np.abs(x2-x1) * (y2-y1)/(x2-x1)])
-                direction = direction / np.linalg.norm(direction)
-                # point = (point[1], point[0])
+                # Unit vector pointing from the arrow end towards the diagram
+                norm = math.hypot(x2-x1, y2-y1)
+                direction = np.array([(x2-x1)/norm, (y2-y1)/norm])
             scan_params.append((point, direction))
             
         return scan_params
 
-    def _search_elsewhere(self, where, arrow, direction, switch):
+    def _search_elsewhere(self, where, arrow, direction, switch, other_idx=None):
         """
         Looks for structures in a different line of a multi-line reaction scheme.
 
         If a reaction scheme ends unexpectedly either on the left or right side of an arrows (no species found), then
         a search is performed in the previous or next line of a reaction scheme respectively (assumes multiple lines
         in a reaction scheme). Assumes left-to-right reaction scheme. Estimates the optimal alternative search point
-        using arrow and diagrams' coordinates in a DBSCAN search.
+        using arrow and diagrams' coordinates in a 1D density-based clustering.
         This gives clusters corresponding to the multiple lines in a reaction scheme. Performs a search in the new spot.
         :param where: Allows either 'down-left' to look below and to the left of arrow, or 'up-right' (above to the right)
         :type where: str
@@ -484,36 +644,36 @@ class RoleProbe:
         :type arrow: BaseArrow
         :param direction: direction of an arrow specified as a unit (x, y) vector
         :type direction: tuple[float, float]
+        :param other_idx: indices of all arrows except `arrow` in `self.arrows`; looked up if not provided
+        :type other_idx: np.ndarray
         :return: Collection of found species
         :rtype: list[Diagram]
         """
         assert where in ['down-left', 'up-right']
         fig = self.fig
-        diags = self.diagrams
 
-        X = np.array([s.center[1] for s in diags] + [arrow.panel.center[1]]).reshape(-1, 1)  # the y-coordinate
-        eps = np.mean([s.height for s in diags])*0.75
-        dbscan = DBSCAN(eps=eps, min_samples=2)
-        y = dbscan.fit_predict(X)
-        num_labels = max(y) - min(y) + 1  # include outliers (labels -1) if any
+        arrow_y = arrow.panel.center[1]
+        X = np.append(self._diag_center[:, 1], arrow_y)  # the y-coordinate
+        eps = self._panel_dims[:, 1].mean()*0.75
+        y = _cluster_1d(X, eps, min_samples=2)
         arrow_label = y[-1]
         clustered = []
-        for val in range(-1, num_labels):
+        for val in np.unique(y):
             if val == arrow_label:
                 continue  # discard this cluster - want to compare the arrow with other clusters only
-            cluster = [centre for centre, label in zip(X, y) if label == val]
-            if cluster:
-                clustered.append(cluster)
-        centres = [np.mean(cluster) for cluster in clustered]
-        centres.sort()
+            clustered.append(X[y == val])
+        centres = np.sort([np.mean(cluster) for cluster in clustered])
         if where == 'down-left':
-            move_to_vertical = [centre for centre in centres if centre > arrow.panel.center[1]][0]
+            idx = np.searchsorted(centres, arrow_y, side='right')  # first line below the arrow
             move_to_horizontal = 0
         elif where == 'up-right':
-            move_to_vertical = [centre for centre in centres if centre < arrow.panel.center[1]][-1]
+            idx = np.searchsorted(centres, arrow_y, side='left') - 1  # last line above the arrow
             move_to_horizontal = fig.img.shape[1]
+        if not 0 <= idx < len(centres):
+            raise IndexError('No other line of the reaction scheme found in this direction')
+        move_to_vertical = centres[idx]
         startpoint = (move_to_horizontal, move_to_vertical)
-        species = self._perform_scan(arrow, self.fig.img.shape, startpoint, direction, switch)
+        species = self._perform_scan(arrow, self.fig.img.shape, startpoint, direction, switch, other_idx=other_idx)
 
         return species
     
@@ -527,22 +687,9 @@ class RoleProbe:
             return panel.center_separation(temp_rect) < prox_dist
     
     def _compute_arrow_scan_params(self, arrow):
-        min_rect = cv2.minAreaRect(arrow.contour[0])
-        box_points = cv2.boxPoints(min_rect)
-        diffs = [box_points[idx+1] - box_points[idx] for idx in range(3)] + [box_points[0] - box_points[-1]]
-        box_segment_lengths = [np.sqrt(np.sum(np.power(x,2))) for x in diffs]
-        largest_idx = np.argmax(box_segment_lengths)
-        points = box_points[largest_idx], box_points[(largest_idx+1)%4]
-        x_diff = points[1][0] - points[0][0]
-        y_diff = points[1][1] - points[0][1]
-        dir_array = np.array([x_diff, y_diff])
-        direction_arrow = dir_array / np.linalg.norm(dir_array)
-
-        direction_normal = np.asarray([-1*direction_arrow[1], direction_arrow[0]])
-
-        return direction_arrow, direction_normal
-
-    def _perform_scan(self, arrow, region_dims, start_point, direction, switch):
+        return arrow.direction, arrow.direction_normal
+
+    def _perform_scan(self, arrow, region_dims, start_point, direction, switch, other_idx=None):
         # assert switch in [-1, 1]
         region_x_length, region_y_length = region_dims
         epsilon = 1e-5  # Avoid division by 0
@@ -554,7 +701,7 @@ class RoleProbe:
         if num_centers == 0:  # Handles a case where no line scan can be performed because the arrow lies close to
                               # image boundary (and no diagrams are present on this boundary)
             return []
-        deltas = np.array([[stepsize_x * n, stepsize_y * n] for n in range(1, num_centers + 1)])
+        deltas = np.arange(1, num_centers + 1)[:, None] * np.array([stepsize_x, stepsize_y])
         deltas = deltas * switch
         start_offset_required = max(arrow.width, arrow.height) / 2
         num_steps_required = int(start_offset_required / max(stepsize_x, stepsize_y))
@@ -563,35 +710,27 @@ class RoleProbe:
         except IndexError:
             pass
         points = start_point + deltas
-        # lines = [Line(find_points_on_line(center, direction_normal, distance=self.segment_length))
-        #              for center in centers]
 
-        # Visualize lines ##
-        # import matplotlib.pyplot as plt
-        # plt.imshow(self.fig.img)
-        # for p in points:
-        #     plt.scatter(*p, c='r')
-        # plt.show()
-
-        try:
-            other_arrows = copy.copy(self.arrows)
-            other_arrows.remove(arrow)
+        if other_idx is None:
+            other_idx = self._other_arrow_idx(arrow)
+        other_max_dims = self._arrow_max_dims[other_idx]
+        arrow_overlap = None
+        if len(other_idx):
             prox_dist = min(max(stepsize_x, stepsize_y) * 4, 50)
-            arrow_overlap = [any(self._check_proximity(p, a.panel, max(max(a.panel.width, a.panel.height) * 0.2, prox_dist)) for a in other_arrows) for p in points].index(True)
-        except ValueError:
-            arrow_overlap = None
+            arrow_prox_dists = np.maximum(other_max_dims * 0.2, prox_dist)
+            # Rows - other arrows, columns - scan points
+            arrow_hits = (edge_separations(self._arrow_bb[other_idx], points) < arrow_prox_dists[:, None]).any(axis=0)
+            if arrow_hits.any():
+                arrow_overlap = int(np.argmax(arrow_hits))
 
         if arrow_overlap is not None and arrow_overlap >= 2: 
             points = points[:arrow_overlap]
-        diags = []
 
-        probe_dist = np.mean([max(a.panel.width, a.panel.height) for a in other_arrows]) * 0.3
+        probe_dist = np.mean(other_max_dims) * 0.3
         probe_dist = max(50, probe_dist)
-        for p in points:
-            for d in self.diagrams:
-                if self._check_proximity(p, d.panel, probe_dist):
-                    diags.append(d)
-        diags = list(set(diags))
+        # Rows - diagrams, columns - scan points
+        diag_hits = (edge_separations(self._diag_bb, points) < probe_dist).any(axis=1)
+        diags = [d for d, hit in zip(self.diagrams, diag_hits) if hit]
 
         return diags
 
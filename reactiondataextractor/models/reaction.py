@@ -16,8 +16,10 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
+import math
 import os
 import re
+from functools import cached_property
 import numpy as np
 from typing import Sequence, List, Tuple, Dict
 from enum import Enum
@@ -26,12 +28,17 @@ import cv2
 
 from reactiondataextractor.configs import ExtractorConfig
 from .base import TextRegion
-from .segments import Panel, PanelMethodsMixin, Figure
+from .segments import Panel, PanelMethodsMixin
 
 log = logging.getLogger('extract.reaction')
 parent_dir = os.path.dirname(os.path.abspath(__file__))
 r_group_correct_file = os.path.join(parent_dir, '..', 'dict', 'r_placeholders.txt')
 
+_NUMBER_RANGE_RE = re.compile(r'\d+-\d+$')
+_LETTER_RANGE_RE = re.compile(r'\d+[A-Za-z]-[A-Za-z]$')
+_LEADING_NUMBER_RE = re.compile(r'\d+')
+_EROSION_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
 class BaseReactionClass(object):
     """
     This is a base.py reaction class placeholder
@@ -45,10 +52,8 @@ class LabelType(Enum):
 
     @staticmethod
     def assign_type(label_text):
-        numbers_only = r'^\d+$'
-        chars_only = r'^[[:alpha:]]+$'
         label_text = label_text.strip()
-        if len(label_text) < 8 and re.search(r'\d+-\d+$', label_text) or re.search(r'\d+[A-Za-z]-[A-Za-z]$', label_text):
+        if len(label_text) < 8 and _NUMBER_RANGE_RE.search(label_text) or _LETTER_RANGE_RE.search(label_text):
             return LabelType.VARIANTS
         else:
             return LabelType.SIMPLE
@@ -65,8 +70,6 @@ class Diagram(BaseReactionClass, PanelMethodsMixin):
     :type smiles: str
     :param children: Labels associated with the diagram
     :type children: List[Label]
-    :param reaction_steps: reaction steps in which the diagram is present
-    :type reaction_steps: List[ReactionStep]
     :param molecule: RDkit molecule generated from diagrams' SMILES. Currently unsupported.
     :type molecule: RDkit.Chem.AllChem.Molecule
     :param corners: all corners (carbon atoms + heteroatoms) found by the vectorisation algorithm
@@ -86,7 +89,6 @@ class Diagram(BaseReactionClass, PanelMethodsMixin):
         self._smiles = smiles
         self._base_smiles = ''
         self.children = [] if labels is None else labels
-        self.reaction_steps = []
         self.molecule = None
         self._base_molecule = None
         self._fingerprint = None
@@ -142,9 +144,9 @@ class ReactionStep(BaseReactionClass):
     :param arrow: arrow associated with this step
     :type arrow: BaseArrow
     :param reactants: reactants of a reaction step
-    :type reactants: frozenset[Diagram]
+    :type reactants: tuple[Diagram]
     :param products: products of a reaction step
-    :type products: frozenset[Diagram]
+    :type products: tuple[Diagram]
     :param single_line: Whether the step lies along a single line, or is divided between two lines in an image
     :type single_line: bool
 
@@ -156,32 +158,25 @@ class ReactionStep(BaseReactionClass):
 
     def __init__(self, arrow, reactants, products, single_line=True):
         self.arrow = arrow
-        self.reactants = reactants
-        self.products = products
-        self._diags = reactants + products
+        self.reactants = tuple(reactants)
+        self.products = tuple(products)
+        self._diags = frozenset(self.reactants + self.products)
         self.single_line = single_line
-        for diag in self._diags:
-            diag.reaction_steps.append(self)
 
     def __eq__(self, other):
-        if isinstance(other, ReactionStep):
-            return (self.reactants == other.reactants and self.products == other.products and
-                    self.arrow == other.arrow)
+        if isinstance(other, ReactionStep):  # Order of species within a group is irrelevant
+            return (frozenset(self.reactants) == frozenset(other.reactants) and
+                    frozenset(self.products) == frozenset(other.products) and self.arrow == other.arrow)
         return False
 
     def __repr__(self):
         return f'ReactionStep(reactants=({self.reactants}),products=({self.products}),{self.conditions}),rsmi=({self.rsmi})'
 
     def __str__(self):
-        reactant_strings = [elem.smiles if elem.smiles else '???' for elem in self.reactants]
-        product_strings = [elem.smiles if elem.smiles else '???' for elem in self.products]
-        # Changed RSMI format to reactants>>products
-        return '..'.join(reactant_strings) + '>>' + '..'.join(product_strings)
+        return self.rsmi
 
     def __hash__(self):
-        all_species = [species for group in iter(self) for species in group]
-        species_hash = sum([hash(species) for species in all_species])
-        return species_hash
+        return hash((frozenset(self.reactants), frozenset(self.products), self.arrow))
 
     def __iter__(self):
         return iter((self.reactants, self.products))
@@ -192,10 +187,12 @@ class ReactionStep(BaseReactionClass):
 
     @property
     def rsmi(self):
-        reactant_strings = [elem.smiles if elem.smiles else '???' for elem in self.reactants]
-        product_strings = [elem.smiles if elem.smiles else '???' for elem in self.products]
         # Changed RSMI format to reactants>>products
-        return '..'.join(reactant_strings) + '>>' + '..'.join(product_strings)
+        return self._smiles_join(self.reactants) + '>>' + self._smiles_join(self.products)
+
+    @staticmethod
+    def _smiles_join(species):
+        return '..'.join(elem.smiles or '???' for elem in species)
 
     # @property
     # def reactants(self):
@@ -298,7 +295,7 @@ class Conditions(TextRegion):
             return False
 
     def __hash__(self):
-        return hash(sum(self.panel.coords))
+        return hash(self.panel)
 
     @property
     def diags(self):
@@ -399,6 +396,13 @@ class Label(TextRegion, PanelMethodsMixin):
     @text.setter
     def text(self, value):
         self._text = value
+        self.__dict__.pop('chemical_number', None)  # invalidate the cached value
+
+    @cached_property
+    def chemical_number(self):
+        """Number at the beginning of the label's text (if any); labels sharing it describe the same compound"""
+        match = _LEADING_NUMBER_RE.match(' '.join(self.text))
+        return match.group(0) if match else None
 
     def __repr__(self):
         return f'Label(panel={self.panel}, text={self.text}, r_groups={self.r_groups})'
@@ -419,13 +423,7 @@ class Label(TextRegion, PanelMethodsMixin):
         self.r_group.append(var_value_label_tuples)
 
     def is_similar_to(self, other_label):
-        text = ' '.join(self.text)
-        other_text = ' '.join(other_label.text)
-        chemical_number_self = re.match(r'\d+', text).group(0)
-        chemical_number_other = re.match(r'\d+', other_text).group(0)
-        if chemical_number_other == chemical_number_self:
-            return True
-        return False
+        return self.chemical_number is not None and self.chemical_number == other_label.chemical_number
 
 
 class BaseArrow(PanelMethodsMixin):
@@ -476,17 +474,65 @@ class BaseArrow(PanelMethodsMixin):
     #     for i in unmerged_idx:
     #         new_children.append(self.children[i])
 
+    @cached_property
+    def min_area_rect_params(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Fits a minimum area rectangle to the arrow's contour and derives its principal directions.
+        The fit is performed once per arrow and reused by all the probing routines.
+        return: unit vector along the longer side of the rectangle, unit vector normal to it, and the longer side's
+        length
+        rtype: tuple"""
+        min_rect = cv2.minAreaRect(self.contour[0])
+        box_points = cv2.boxPoints(min_rect)
+        sides = np.roll(box_points, -1, axis=0) - box_points  # side i joins box points i and i+1
+        box_segment_lengths = np.sqrt(np.sum(sides**2, axis=1))
+        largest_idx = np.argmax(box_segment_lengths)
+        x_diff, y_diff = map(float, sides[largest_idx])
+        length = math.hypot(x_diff, y_diff)
+        dir_x, dir_y = x_diff / length, y_diff / length
+        direction_arrow = np.array([dir_x, dir_y])
+        direction_normal = np.array([-dir_y, dir_x])
+
+        return direction_arrow, direction_normal, box_segment_lengths[largest_idx]
+
+    @property
+    def direction(self) -> np.ndarray:
+        return self.min_area_rect_params[0]
+
+    @property
+    def direction_normal(self) -> np.ndarray:
+        return self.min_area_rect_params[1]
+
+    @property
+    def major_axis_length(self) -> float:
+        return self.min_area_rect_params[2]
+
     def initialize(self) -> None:
         """Given `pixels` and `panel` attributes, this method checks if other (relevant) initialization attributes
         have been precomputed. If not, these should be computed and set accordingly."""
         if self.contour is None:
-            img = np.zeros_like(self.panel.fig.img)
-            img[self.panel.pixels] = 255
-            cnt, _ = cv2.findContours(img,
-                                      ExtractorConfig.ARROW_CNT_MODE, ExtractorConfig.ARROW_CNT_METHOD)
+            pad_width = 10
+            mask = self._padded_mask(pad_width)
+            offset = (self.panel.left - pad_width, self.panel.top - pad_width)
+            cnt, _ = cv2.findContours(mask, ExtractorConfig.ARROW_CNT_MODE, ExtractorConfig.ARROW_CNT_METHOD,
+                                      offset=offset)
             assert len(cnt) <=2
             self.contour = cnt
 
+    def _padded_mask(self, pad_width: int) -> np.ndarray:
+        """Draws the arrow's pixels into a zero-padded mask spanning only the arrow's panel. Pixels falling outside
+        the padded panel are discarded, as they would be when cropping a full-size mask
+        :param pad_width: padding added on each side of the panel
+        :type pad_width: int
+        :return: uint8 mask with the arrow's pixels set to 255
+        :rtype: np.ndarray"""
+        panel = self.panel
+        mask = np.zeros((panel.height + 2*pad_width, panel.width + 2*pad_width), dtype=np.uint8)
+        rows = np.asarray(panel.pixels[0]) - panel.top + pad_width
+        cols = np.asarray(panel.pixels[1]) - panel.left + pad_width
+        inside = (rows >= 0) & (rows < mask.shape[0]) & (cols >= 0) & (cols < mask.shape[1])
+        mask[rows[inside], cols[inside]] = 255
+        return mask
+
     def compute_reaction_reference_pt(self) -> Tuple[float]:
         """Computes a reference point for a reaction step. This point alongside arrow's center point is used to decide
         whether a diagram belongs to reactants or products of a step (by comparing pairwise distances).
@@ -497,16 +543,16 @@ class BaseArrow(PanelMethodsMixin):
         ''
         scaling_factor = 2
         pad_width = 10
-        img = np.zeros_like(self.panel.fig.img)
-        img[self.panel.pixels] = 255
-        crop = self.panel.create_padded_crop(Figure(img, img), pad_width).img
+        crop = self._padded_mask(pad_width)
         crop = cv2.resize(crop, (0, 0), fx=scaling_factor, fy=scaling_factor)
-        eroded = cv2.erode(crop, np.ones((3, 3)), iterations=2)
+        eroded = cv2.erode(crop, _EROSION_KERNEL, iterations=2)
 
         #Compute COM in the crop, then transform back to main figure coordinates
-        rows, cols = np.nonzero(eroded>200)
-        rows, cols = rows/scaling_factor - pad_width, cols/scaling_factor - pad_width
-        row, col = int(np.mean(rows)), int(np.mean(cols))
+        moments = cv2.moments((eroded > 200).astype(np.uint8), binaryImage=True)
+        if moments['m00'] == 0:
+            raise ValueError('The arrow vanished upon erosion')
+        row = int(moments['m01'] / moments['m00'] / scaling_factor - pad_width)
+        col = int(moments['m10'] / moments['m00'] / scaling_factor - pad_width)
         top, left = self.panel.top, self.panel.left
         row, col = row + top, col + left        
         return col, row  # x, y
@@ -542,7 +588,7 @@ class SolidArrow(BaseArrow):
         return self.panel == other.panel
 
     def __hash__(self):
-        return hash(pixel for pixel in self.pixels)
+        return hash(self.panel)
 
 
 class CurlyArrow(BaseArrow):
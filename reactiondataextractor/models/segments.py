@@ -20,6 +20,7 @@ from __future__ import division
 
 from collections.abc import Sequence
 from collections.abc import Collection
+import math
 import numpy as np
 from enum import Enum
 from functools import wraps
@@ -35,6 +36,9 @@ from .geometry import Line, Point
 
 log = logging.getLogger('extract.segments')
 
+# Block-based labelling with decision forests; Spaghetti is only available in more recent OpenCV versions
+_CCL_ALGORITHM = getattr(cv2, 'CCL_SPAGHETTI', cv2.CCL_BBDT)
+
 
 def coords_deco(cls):
     """Decorator allowing accessing coordinates of panels directly from objects that have ``panel`` attributes"""
@@ -139,6 +143,7 @@ class Rect(object):
     A rectangular region.
     Base class for all panels.
     """
+    __slots__ = ('_coords', '_width', '_height', '_center')
 
     @classmethod
     def create_megarect(cls, boxes: List['Rect']):
@@ -147,67 +152,85 @@ class Rect(object):
         :param iterable boxes: list of bounding boxes to combine into a larger box
         :return: a large rectangle covering all smaller rectangles
         """
-        # print('boxes:', boxes)
-        top = min(rect.top for rect in boxes)
-        bottom = max(rect.bottom for rect in boxes)
-        left = min(rect.left for rect in boxes)
-        right = max(rect.right for rect in boxes)
-
-        megabox = cls((top, left, bottom, right))
+        megabox = cls(cls._enclosing_coords(boxes))
         return megabox
 
     def  __init__(self, coords):
         """
         :param (int, int, int, int): (top, left, bottom, right) coordinates of top-left and bottom-right rectangle points
         """
-        self.coords = list(coords)
+        self.coords = coords
 
+    @property
+    def coords(self):
+        return self._coords
+
+    @coords.setter
+    def coords(self, value):
+        self._coords = tuple(value)
+        self._reset_cached_dims()
+
+    def _set_coord(self, idx, value):
+        """Replaces a single coordinate at `idx` in the (top, left, bottom, right) coordinate tuple"""
+        coords = self._coords
+        self._coords = coords[:idx] + (value,) + coords[idx+1:]
+        self._reset_cached_dims()
+
+    def _reset_cached_dims(self):
+        """Invalidates dimensions derived from the coordinates. Needs to be called whenever the coordinates change"""
+        self._width = None
+        self._height = None
+        self._center = None
 
     @property
     def top(self):
-        return self.coords[0]
+        return self._coords[0]
 
     @top.setter
     def top(self, value):
-        self.coords[0] = value
+        self._set_coord(0, value)
 
     @property
     def left(self):
-        return self.coords[1]
+        return self._coords[1]
 
     @left.setter
     def left(self, value):
-        self.coords[1] = value
+        self._set_coord(1, value)
 
     @property
     def bottom(self):
-        return self.coords[2]
+        return self._coords[2]
 
     @bottom.setter
     def bottom(self, value):
-        self.coords[2] = value
+        self._set_coord(2, value)
 
     @property
     def right(self):
-        return self.coords[3]
+        return self._coords[3]
 
     @right.setter
     def right(self, value):
-        self.coords[3] = value
+        self._set_coord(3, value)
 
     @property
     def width(self):
         """Return width of rectangle in pixels. May be floating point value.
         :rtype: int
         """
-        return self.right - self.left
+        if self._width is None:
+            self._width = self._coords[3] - self._coords[1]
+        return self._width
 
     @property
     def height(self):
         """Return height of rectangle in pixels. May be floating point value.
         :rtype: int
         """
-        return self.bottom - self.top
+        if self._height is None:
+            self._height = self._coords[2] - self._coords[0]
+        return self._height
 
     @property
     def aspect_ratio(self):
@@ -236,16 +259,19 @@ class Rect(object):
         """
         Return the length of diagonal of a connected component as a float.
         """
-        return np.hypot(self.height, self.width)
+        return math.hypot(self.height, self.width)
 
     @property
     def center(self):
         """Center point of rectangle. May be floating point values.
         :rtype: tuple(int|float, int|float)
         """
-        xcenter = (self.left + self.right) / 2 if self.left is not None and self.right else None
-        ycenter = (self.bottom + self.top) / 2
-        return xcenter, ycenter
+        if self._center is None:
+            top, left, bottom, right = self._coords
+            xcenter = (left + right) / 2 if left is not None and right else None
+            ycenter = (bottom + top) / 2
+            self._center = xcenter, ycenter
+        return self._center
 
     @property
     def geometric_centre(self):
@@ -271,13 +297,13 @@ class Rect(object):
             return False
 
     def __call__(self):
-        return self.top, self.left, self.bottom, self.right
+        return self._coords
 
     def __iter__(self):
-        return iter([self.top, self.left, self.bottom, self.right])
+        return iter(self._coords)
 
     def __hash__(self):
-        return hash((self.top, self.left, self.bottom, self.right))
+        return hash(self._coords)
 
     def to_json(self):
         return f"[{', '.join(map(str, self()))}]"
@@ -288,9 +314,10 @@ class Rect(object):
         :return: Whether ``other_rect`` is within this rect.
         :rtype: bool
         """
-
-        return (other_rect.left >= self.left and other_rect.right <= self.right and
-                other_rect.top >= self.top and other_rect.bottom <= self.bottom)
+        top, left, bottom, right = self.coords
+        other_top, other_left, other_bottom, other_right = getattr(other_rect, 'panel', other_rect).coords
+        return (other_left >= left and other_right <= right and
+                other_top >= top and other_bottom <= bottom)
 
     def contains_point(self, point: Union[Tuple[int], 'Point']):
         """Returns True if a point lies inside self, else returns False
@@ -318,12 +345,88 @@ class Rect(object):
             overlaps = (min(self.right, other.right) > max(self.left, other.left) and
                         min(self.bottom, other.bottom) > max(self.top, other.top))
         elif isinstance(other, Line):
-            overlaps = any(p.row in range(self.top, self.bottom) and
-                           p.col in range(self.left, self.right) for p in other.pixels)
+            top, left, bottom, right = self
+            overlaps = any(top <= p.row < bottom and left <= p.col < right for p in other.pixels)
         else:
             return NotImplemented
         return overlaps
 
+    @staticmethod
+    def stack_coords(rects: List['Rect'], dtype: Union[type, None] = float) -> np.ndarray:
+        """Stacks coordinates of rectangles (or objects with a ``panel`` attribute) into a single array
+        :param rects: rectangles to stack
+        :type rects: list[Rect]
+        :param dtype: dtype of the array; inferred from the coordinates if None
+        :type dtype: type|None
+        :return: (N, 4) array with rows (top, left, bottom, right)
+        :rtype: np.ndarray
+        """
+        return np.array([getattr(rect, 'panel', rect).coords for rect in rects], dtype=dtype).reshape(-1, 4)
+
+    @classmethod
+    def _enclosing_coords(cls, boxes: List['Rect']) -> Tuple:
+        """Finds (top, left, bottom, right) coordinates of the smallest rectangle enclosing all `boxes`"""
+        coords = cls.stack_coords(boxes, dtype=None)
+        top, left = coords[:, :2].min(axis=0).tolist()
+        bottom, right = coords[:, 2:].max(axis=0).tolist()
+        return top, left, bottom, right
+
+    @classmethod
+    def pairwise_center_separation(cls, rects_a: Union[List['Rect'], np.ndarray],
+                                   rects_b: Union[List['Rect'], np.ndarray]) -> np.ndarray:
+        """Computes `center_separation` between all pairs of rectangles in a single broadcast operation
+        :param rects_a: rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_a: list[Rect]|np.ndarray
+        :param rects_b: other rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_b: list[Rect]|np.ndarray
+        :return: (len(rects_a), len(rects_b)) array of distances
+        :rtype: np.ndarray
+        """
+        coords_a, coords_b = [rects if isinstance(rects, np.ndarray) else cls.stack_coords(rects)
+                              for rects in (rects_a, rects_b)]
+        centers_a = 0.5 * (coords_a[:, :2] + coords_a[:, 2:])
+        centers_b = 0.5 * (coords_b[:, :2] + coords_b[:, 2:])
+        diffs = centers_a[:, None, :] - centers_b[None, :, :]
+        return np.hypot(diffs[..., 0], diffs[..., 1])
+
+    @classmethod
+    def pairwise_edge_separation(cls, rects_a: Union[List['Rect'], np.ndarray],
+                                 rects_b: Union[List['Rect'], np.ndarray]) -> np.ndarray:
+        """Computes `edge_separation` between all pairs of rectangles in a single broadcast operation. Overlapping
+        rectangles are separated by 0
+        :param rects_a: rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_a: list[Rect]|np.ndarray
+        :param rects_b: other rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_b: list[Rect]|np.ndarray
+        :return: (len(rects_a), len(rects_b)) array of distances
+        :rtype: np.ndarray
+        """
+        coords_a, coords_b = [rects if isinstance(rects, np.ndarray) else cls.stack_coords(rects)
+                              for rects in (rects_a, rects_b)]
+        t1, l1, b1, r1 = (coords_a[:, idx, None] for idx in range(4))
+        t2, l2, b2, r2 = (coords_b[None, :, idx] for idx in range(4))
+        dx = np.maximum(np.maximum(l1 - r2, l2 - r1), 0)
+        dy = np.maximum(np.maximum(t1 - b2, t2 - b1), 0)
+        return np.hypot(dx, dy)
+
+    @classmethod
+    def contains_matrix(cls, rects_a: Union[List['Rect'], np.ndarray],
+                        rects_b: Union[List['Rect'], np.ndarray]) -> np.ndarray:
+        """Evaluates `contains` between all pairs of rectangles in a single broadcast operation
+        :param rects_a: rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_a: list[Rect]|np.ndarray
+        :param rects_b: other rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_b: list[Rect]|np.ndarray
+        :return: (len(rects_a), len(rects_b)) boolean array, True where a rectangle from `rects_a` contains one from
+        `rects_b`
+        :rtype: np.ndarray
+        """
+        coords_a, coords_b = [rects if isinstance(rects, np.ndarray) else cls.stack_coords(rects)
+                              for rects in (rects_a, rects_b)]
+        t1, l1, b1, r1 = (coords_a[:, idx, None] for idx in range(4))
+        t2, l2, b2, r2 = (coords_b[None, :, idx] for idx in range(4))
+        return (l2 >= l1) & (r2 <= r1) & (t2 >= t1) & (b2 <= b1)
+
     def center_separation(self, other: Union['Point', Tuple[int], 'Rect']) -> float:
         """ Returns the distance between the center of each graph
         :param Rect other: Another rectangle
@@ -343,7 +446,7 @@ class Rect(object):
             x, y = other
         height = abs(self.center[0] - x)
         length = abs(self.center[1] - y)
-        return np.hypot(length, height)
+        return math.hypot(length, height)
 
     def edge_separation(self, other: Union['Point', Tuple[int], 'Rect']) -> int:
         """Cqlculates the distance between the closest edges or corners of two rectangles or a rectangle and a point.
@@ -356,42 +459,16 @@ class Rect(object):
             other = Rect([y, x, y, x])
         return self._edge_separation_rect(other)
 
-    def _edge_separation_rect(self, other_rect: 'Rect') -> int:
+    def _edge_separation_rect(self, other_rect: 'Rect') -> float:
         """Calculates the distance between the closest edges or corners of two rectangles. If the two overlap, the
         distance is set to 0
         :param other_rect: another rectangle to which the distance is computed
         :type other_rect: Rect"""
-        def dist(p1, p2):
-            x1, y1 = p1
-            x2, y2 = p2
-            width = x2 - x1
-            height = y2 - y1
-            return np.hypot(width, height)
         t1, l1, b1, r1 = self
         t2, l2, b2, r2 = other_rect
-
-        left = r2 < l1
-        right = r1 < l2
-        bottom = b1 < t2
-        top = b2 < t1
-        if top and left:
-            return dist((l1, t1), (r2, b2))
-        elif bottom and left:
-            return dist((l1, t1), (r2, t2))
-        elif bottom and right:
-            return dist((r1, t1), (l2, t2))
-        elif right and top:
-            return dist((r1, b1), (l2, b2))
-        elif left:
-            return l1 - r2
-        elif right:
-            return l2 - r1
-        elif bottom:
-            return t2 - b1
-        elif top:
-            return t1 - b2
-        else:  # rectangles intersect
-            return 0.
+        dx = max(0, l1 - r2, l2 - r1)
+        dy = max(0, t1 - b2, t2 - b1)
+        return math.hypot(dx, dy)
 
     def find_relative_orientation(self, other_rect: 'Rect') -> Tuple[bool]:
         """Returns four booleans (top, left, bottom, right) describing relative orientation
@@ -452,28 +529,42 @@ class Rect(object):
         :return: IoU value
         :rtype: float
         """
-        xa, ya, wa, ha = self
-        xb, yb, wb, hb = other_rect
-        x1_inter = max(xa, xb)
-        y1_inter = max(ya, yb)
-        x2_inter = min(xa + wa, xb + wb)
-        y2_inter = min(ya + ha, yb + hb)
+        t1, l1, b1, r1 = self
+        t2, l2, b2, r2 = other_rect
+        w_inter = min(r1, r2) - max(l1, l2)
+        h_inter = min(b1, b2) - max(t1, t2)
 
-        if x2_inter < x1_inter or y2_inter < y1_inter:
+        if w_inter <= 0 or h_inter <= 0:
             return 0.0
 
-        area_a = wa * ha
-        area_b = wb * hb
-
-        w_inter = x2_inter - x1_inter
-        h_inter = y2_inter - y1_inter
-
         area_intersection = w_inter * h_inter
-        iou = area_intersection / (area_a + area_b - area_intersection)
+        iou = area_intersection / ((r1 - l1) * (b1 - t1) + (r2 - l2) * (b2 - t2) - area_intersection)
         return iou
 
+    @classmethod
+    def iou_matrix(cls, rects_a: Union[List['Rect'], np.ndarray], rects_b: Union[List['Rect'], np.ndarray]) -> np.ndarray:
+        """Computes `compute_iou` between all pairs of rectangles in a single broadcast operation
+        :param rects_a: rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_a: list[Rect]|np.ndarray
+        :param rects_b: other rectangles, or their coordinates as returned by `stack_coords`
+        :type rects_b: list[Rect]|np.ndarray
+        :return: (len(rects_a), len(rects_b)) array of IoU values
+        :rtype: np.ndarray
+        """
+        coords_a, coords_b = [rects if isinstance(rects, np.ndarray) else cls.stack_coords(rects)
+                              for rects in (rects_a, rects_b)]
+        t1, l1, b1, r1 = (coords_a[:, idx, None] for idx in range(4))
+        t2, l2, b2, r2 = (coords_b[None, :, idx] for idx in range(4))
+        w_inter = np.clip(np.minimum(r1, r2) - np.maximum(l1, l2), 0, None)
+        h_inter = np.clip(np.minimum(b1, b2) - np.maximum(t1, t2), 0, None)
+        area_intersection = w_inter * h_inter
+        area_union = (r1 - l1) * (b1 - t1) + (r2 - l2) * (b2 - t2) - area_intersection
+        return np.divide(area_intersection, area_union, out=np.zeros_like(area_intersection),
+                         where=area_intersection > 0)
+
 
 class Panel(Rect, figure.GlobalFigureMixin):
+    __slots__ = ('fig', 'tags', 'role', 'parent_panel', '_crop', '_pixel_ratio', '_pixels', '_zipped_pixels')
 
     @classmethod
     def create_megapanel(cls, boxes: List['Panel'], fig: 'Figure') -> 'Panel':
@@ -483,10 +574,7 @@ class Panel(Rect, figure.GlobalFigureMixin):
         :param iterable boxes: list of bounding boxes to combine into a larger box
         :return: a large rectangle covering all smaller rectangles
         """
-        top = min(rect.top for rect in boxes)
-        bottom = max(rect.bottom for rect in boxes)
-        left = min(rect.left for rect in boxes)
-        right = max(rect.right for rect in boxes)
+        top, left, bottom, right = cls._enclosing_coords(boxes)
         tags = []
         for panel in boxes:
             if panel.tags:
@@ -537,13 +625,8 @@ class Panel(Rect, figure.GlobalFigureMixin):
     def pixels(self):
         """All pixels belonging to `self` in `self.fig.img`"""
         if not self._pixels:
-            x, y = [], []
-            for tag in self.tags:
-                y_tag, x_tag = np.where(self.fig.labelled_img == tag)
-                x.extend(x_tag)
-                y.extend(y_tag)
-            self._pixels = y, x
-            self._zipped_pixels = set(zip(*self._pixels))
+            self._pixels = self.fig.find_labelled_pixels(self.tags)
+            self._zipped_pixels = frozenset(zip(*self._pixels))
         return self._pixels
     
     def mask_off(self, fig: 'Figure') -> None:
@@ -559,39 +642,43 @@ class Panel(Rect, figure.GlobalFigureMixin):
         :return: Panel; super-panel made from all connected components that constitute the large panel in raw figure
         :rtype: Panel
         """
-        ccs_to_merge = [cc for cc in fig.connected_components if self.contains(cc)]
+        ccs_to_merge = fig.find_ccs_within(self)
         return Rect.create_megarect(ccs_to_merge)
 
     def in_original_fig(self, as_str: bool=True) -> Union[Tuple, str]:
         """Transforms `self.coords` to the define the same panel in the main figure. If the figure has not been rescaled,
-        returns `self.coords`. Returns either a tuple of values or a string for easier export to file."""
+        returns `self.coords` as a list. Returns either a tuple of values or a string for easier export to file."""
 
         assert self.fig is not None, "Cannot convert coordinates to original values - this panel has not been associated" \
                                      " with any figure"
         if self.fig._scaling_factor:
             ret = list(np.rint(np.asarray(self.coords) / self.fig.scaling_factor).astype(np.int32))
         else:
-            ret = self.coords
+            ret = list(self.coords)
         if as_str:
             ret = list(map(str, ret))
         return ret
 
-    def contains_any_pixel_of(self, other_panel: 'Panel') -> 'Panel':
+    def contains_any_pixel_of(self, other_panel: 'Panel') -> bool:
         """Checks whether `self` contains any pixel of `other_panel`. This check is more
         sensitive than simply checking IoU between boxes.
 
         :param other_panel: another panel, pixels of which are checked against `self.pixels`
         :type other_panel: Panel
         :return: True if any pixels are within both `self` and `other_panel`
-        :rtype: Panel
+        :rtype: bool
         """
-        if self.pixels:
-            zipped_pixels = self._zipped_pixels
-        if other_panel.pixels:
-            other_zipped_pixels = other_panel._zipped_pixels
-        if len(zipped_pixels.intersection(other_zipped_pixels)) > 0:
-            return True
-        return False
+        labelled, other_labelled = self.fig.labelled_img, other_panel.fig.labelled_img
+        # Pixels of both panels can only coincide within the overlap of their boxes
+        top, left = max(self.top, other_panel.top, 0), max(self.left, other_panel.left, 0)
+        bottom = min(self.bottom, other_panel.bottom, labelled.shape[0], other_labelled.shape[0])
+        right = min(self.right, other_panel.right, labelled.shape[1], other_labelled.shape[1])
+        if top >= bottom or left >= right:
+            return False
+        window = np.s_[top:bottom, left:right]
+        self_mask = self.fig.tag_bitmap(self.tags)[labelled[window]]
+        other_mask = other_panel.fig.tag_bitmap(other_panel.tags)[other_labelled[window]]
+        return bool(np.any(self_mask & other_mask))
 
 class Figure(object):
     """A class describing the processed figure."""
@@ -606,12 +693,16 @@ class Figure(object):
         :param numpy.ndarray labelled_img: an array of tags returned by the routine searching for connected components 
         """
         self._connected_components = None
+        self._cc_coords = None
         self._img = None
+        self._labelled_img = None
         self.eager_cc_init = eager_cc_init
         self._img = img
         self.raw_img = raw_img
         self.img_detectron = img_detectron
         self.labelled_img = None
+        self._num_labels = None
+        self._labelled_pixels_index = None
         self.single_bond_length = None
         self.width, self.height = img.shape[1], img.shape[0]
         self.center = (int(self.width * 0.5), int(self.height) * 0.5)
@@ -630,6 +721,17 @@ class Figure(object):
     @connected_components.setter
     def connected_components(self, value):
         self._connected_components = value
+        self._cc_coords = None
+
+    @property
+    def labelled_img(self):
+        if self._labelled_img is None:
+            self.connected_components  # Labels are discarded when the image changes - recompute them on demand
+        return self._labelled_img
+
+    @labelled_img.setter
+    def labelled_img(self, value):
+        self._labelled_img = value
 
     @property
     def scaling_factor(self):
@@ -637,11 +739,20 @@ class Figure(object):
 
     @img.setter
     def img(self, value):
-        if self._img is None:
-            self._img = value
-        else:
-            self._img = value
+        self._img = value
+        if self.eager_cc_init and self._connected_components is not None:
             self.set_connected_components()
+        else:
+            self._reset_connected_components()
+
+    def _reset_connected_components(self):
+        """Discards the connected components and all data derived from them. These are recomputed on next access
+        to `self.connected_components`"""
+        self._connected_components = None
+        self._cc_coords = None
+        self.labelled_img = None
+        self._num_labels = None
+        self._labelled_pixels_index = None
 
     def __repr__(self):
         return '<%s>' % self.__class__.__name__
@@ -654,7 +765,7 @@ class Figure(object):
 
     @property
     def diagonal(self):
-        return np.hypot(self.width, self.height)
+        return math.hypot(self.width, self.height)
 
     @property
     def area(self):
@@ -673,18 +784,92 @@ class Figure(object):
         Convenience function that tags ccs in an img and creates their Panels
         :return set: set of Panels of connected components
         """
-        panels = []
-        _, labelled, stats, _ = cv2.connectedComponentsWithStats(cv2.threshold
-                                                          (self.img, *ProcessorConfig.BIN_THRESH, cv2.THRESH_BINARY)[1],
-                                                          connectivity=8)
+        binarised = cv2.threshold(self.img, *ProcessorConfig.BIN_THRESH, cv2.THRESH_BINARY)[1]
+        # An 8-connected image holds at most one cc per 2x2 block - use 16-bit labels whenever these cannot overflow
+        height, width = binarised.shape[:2]
+        max_num_ccs = -(-height // 2) * -(-width // 2) + 1
+        ltype = cv2.CV_16U if max_num_ccs <= np.iinfo(np.uint16).max else cv2.CV_32S
+        num_labels, labelled, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(binarised, 8, ltype,
+                                                                                        _CCL_ALGORITHM)
+        if labelled.dtype != np.uint16 and num_labels <= np.iinfo(np.uint16).max:
+            labelled = labelled.astype(np.uint16)
         self.labelled_img = labelled
-        for label, cc_stat in enumerate(stats):
-            x1, y1, w, h, _ = cc_stat
-            if w*h < self.area * 0.95:  # Spurious cc encompassing the whole image is sometimes produced
-                x2, y2 = x1 + w, y1 + h
-                panels.append(Panel((y1, x1, y2, x2), fig=self, tags=[label]))
+        self._num_labels = num_labels
+        self._labelled_pixels_index = None
+        x1, y1, w, h = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_WIDTH], \
+            stats[:, cv2.CC_STAT_HEIGHT]
+        keep = w * h < self.area * 0.95  # Spurious cc encompassing the whole image is sometimes produced
+        labels = np.flatnonzero(keep)
+        cc_coords = np.stack([y1, x1, y1 + h, x1 + w], axis=1)[labels]
+
+        self._connected_components = [Panel(coords, fig=self, tags=[label])
+                                      for label, coords in zip(labels.tolist(), cc_coords.tolist())]
+        self._cc_coords = cc_coords
 
-        self._connected_components = panels
+    @property
+    def cc_coords(self) -> np.ndarray:
+        """Coordinates of all connected components stacked into an (N, 4) array, used for vectorised spatial queries.
+        The array is discarded by the `connected_components` setter and rebuilt on next access"""
+        ccs = self.connected_components
+        if self._cc_coords is None:
+            self._cc_coords = Rect.stack_coords(ccs)
+        return self._cc_coords
+
+    def find_ccs_within(self, rect: 'Rect') -> List['Panel']:
+        """Finds all connected components lying entirely within `rect`
+        :param rect: rectangle inside which the connected components are sought
+        :type rect: Rect
+        :return: connected components within `rect`, in the order of `self.connected_components`
+        :rtype: list[Panel]
+        """
+        within = Rect.contains_matrix([rect], self.cc_coords)[0]
+        ccs = self.connected_components
+        return [ccs[idx] for idx in np.flatnonzero(within)]
+
+    def find_ccs_containing(self, rect: 'Rect') -> List['Panel']:
+        """Finds all connected components which entirely contain `rect`
+        :param rect: rectangle which the connected components should contain
+        :type rect: Rect
+        :return: connected components containing `rect`, in the order of `self.connected_components`
+        :rtype: list[Panel]
+        """
+        containing = Rect.contains_matrix(self.cc_coords, [rect])[:, 0]
+        ccs = self.connected_components
+        return [ccs[idx] for idx in np.flatnonzero(containing)]
+
+    def find_labelled_pixels(self, tags: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds all pixels of `self.labelled_img` labelled with any of `tags`.
+        On first call, pixel indices are grouped by label with a single sort of the labelled image, so that each
+        lookup only slices that index rather than scanning the whole image
+        :param tags: labels of connected components
+        :type tags: list[int]
+        :return: rows and columns of the pixels, in row-major order within each tag
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        if self._labelled_pixels_index is None:
+            flat = self.labelled_img.ravel()
+            order = np.argsort(flat, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(flat))])
+            self._labelled_pixels_index = order, offsets
+        order, offsets = self._labelled_pixels_index
+        num_labels = len(offsets) - 1
+        idxs = [order[offsets[tag]:offsets[tag+1]] for tag in tags if 0 <= tag < num_labels]
+        idxs = np.concatenate(idxs) if idxs else np.zeros(0, dtype=order.dtype)
+        return np.unravel_index(idxs, self.labelled_img.shape)
+
+    def tag_bitmap(self, tags: List[int]) -> np.ndarray:
+        """Creates a lookup table marking `tags` among all labels of `self.labelled_img`.
+        Indexing the table with (a region of) `self.labelled_img` yields the mask of pixels labelled with any of `tags`
+        :param tags: labels of connected components
+        :type tags: list[int]
+        :return: boolean array of length equal to the number of labels
+        :rtype: np.ndarray
+        """
+        self.labelled_img  # Make sure the labels (and their count) are up to date
+        bitmap = np.zeros(self._num_labels, dtype=bool)
+        tags = np.asarray(tags, dtype=np.intp)
+        bitmap[tags[(tags >= 0) & (tags < self._num_labels)]] = True
+        return bitmap
 
     def resize(self, *args,  eager_cc_init=True, **kwargs):
         """Simple wrapper around opencv resize"""
@@ -692,8 +877,7 @@ class Figure(object):
 
     def set_roles(self, panels, role):
         for panel in panels:
-            parent_cc = [cc for cc in self.connected_components if cc.contains(panel)]
-            for cc in parent_cc:
+            for cc in self.find_ccs_containing(panel):
                 cc.role = role
 
 
@@ -725,17 +909,32 @@ class Crop(Figure):
         :rtype: Crop
         """
 
-        self.img = np.pad(self.img, pad_width=pad_width)
+        # Connected components are found in the padded image when next needed, already in padded coordinates
+        self.img = self._pad_img(self.img, pad_width)
         self.padding = pad_width
         self._top_padding = pad_width if isinstance(pad_width, int) else pad_width[0][0]
         self._left_padding = pad_width if isinstance(pad_width, int) else pad_width[1][0]
 
-        for cc in self.connected_components:
-            cc.top, cc.bottom = cc.top + self._top_padding, cc.bottom + self._top_padding
-            cc.left, cc.right = cc.left + self._left_padding, cc.right + self._left_padding
-
         return self
 
+    @staticmethod
+    def _pad_img(img: np.ndarray, pad_width: Union[Sequence, int]) -> np.ndarray:
+        """Pads `img` with zeros. Single-channel images are padded with cv2.copyMakeBorder, with numpy.pad as fallback
+        for all other images and forms of `pad_width`
+        :param img: image to pad
+        :type img: np.ndarray
+        :param pad_width: padding width, as in numpy.pad
+        :type pad_width: Union[Sequence, int]
+        :return: padded image
+        :rtype: np.ndarray
+        """
+        cv2_dtypes = (np.uint8, np.int8, np.uint16, np.int16, np.int32, np.float32, np.float64)
+        widths = np.broadcast_to(pad_width, (2, 2)) if np.ndim(pad_width) in (0, 2) else None
+        if img.ndim == 2 and img.dtype in cv2_dtypes and widths is not None:
+            (top, bottom), (left, right) = widths.tolist()
+            return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=0)
+        return np.pad(img, pad_width=pad_width)
+
     def in_main_fig(self, element: Union['Panel', 'Point']) -> Union['Panel', 'Point']:
         """
         Transforms coordinates of ``cc`` (from ``self.connected_components``) to give coordinates of the
@@ -806,6 +1005,6 @@ class Crop(Figure):
 
         self.cropped_rect = Rect((top, left, bottom, right))
 
-        super().__init__(out_img, out_raw_img, img_detectron=out_detectron_img)
+        super().__init__(out_img, out_raw_img, img_detectron=out_detectron_img, eager_cc_init=False)
         if img_detectron is not None:
             self._scaling_factor = self.main_figure.scaling_factor
@@ -52,6 +52,7 @@ CONDITIONS_WHITELIST = DIGITS + ALPHABET_UPPER + ALPHABET_LOWER + CONCENTRATION
 CHAR_WHITELIST = DIGITS + '+' + ALPHABET_UPPER + ALPHABET_LOWER + "',\""
 
 OCR_CONFIDENCE = 70
+_PREPROCESS_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
 
 # api = tesserocr.PyTessBaseAPI(path=OCRConfig.TESSDATA_PATH, oem=tesserocr.OEM.TESSERACT_ONLY)
 api = tesserocr.PyTessBaseAPI(init=False)
@@ -128,10 +129,9 @@ def img_to_text(img: np.ndarray,
 def _cv2_preprocess(img):
 
     img = cv2.resize(img, (0,0), fx=4, fy=4)
-    kernel = np.ones((3, 3), np.uint8)
 
-    img = cv2.erode(img, kernel, iterations=1)
-    img = cv2.dilate(img, kernel, iterations=1)
+    img = cv2.erode(img, _PREPROCESS_KERNEL, iterations=1)
+    img = cv2.dilate(img, _PREPROCESS_KERNEL, iterations=1)
 
     img = cv2.threshold(img, 40, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
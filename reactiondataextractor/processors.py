@@ -1,5 +1,5 @@
 import os
-from copy import deepcopy
+from copy import copy
 from enum import Enum, auto
 from abc import ABC, abstractmethod
 import imageio as imageio
@@ -8,7 +8,6 @@ from typing import Union, Tuple
 
 import cv2
 from PIL import Image
-from scipy.stats import mode
 
 from reactiondataextractor.configs.figure import GlobalFigureMixin
 from reactiondataextractor.models.segments import Figure
@@ -38,6 +37,12 @@ class ImageProcessor(ABC, GlobalFigureMixin):
 
 class ImageReader(ImageProcessor):
     """Class for reading an image file. Reads jpg/jpeg, png, bmp, as well as single images in gif format"""
+    # cv2 color conversion codes for gif frames, keyed by the number of channels (1 - gray, 3 - RGB, 4 - RGBA)
+    _GIF_TO_DETECTRON_CODES = {1: cv2.COLOR_GRAY2BGR, 4: cv2.COLOR_RGBA2BGR}
+    _GIF_CONVERSION_CODES = {(ImageProcessor.COLOR_MODE.GRAY, 4): cv2.COLOR_RGBA2GRAY,
+                             (ImageProcessor.COLOR_MODE.GRAY, 3): cv2.COLOR_RGB2GRAY,
+                             (ImageProcessor.COLOR_MODE.RGB, 4): cv2.COLOR_RGBA2RGB,
+                             (ImageProcessor.COLOR_MODE.RGB, 1): cv2.COLOR_GRAY2RGB}
     def __init__(self, filepath: str, color_mode: 'ImageProcessor.COLOR_MODE'):
         """init method. Takes in filepath as well as color mode (gray or RGB). RGB mode support is currently limited.
         
@@ -52,52 +57,55 @@ class ImageReader(ImageProcessor):
         assert os.path.exists(filepath), "Could not open file - Invalid path was entered"
         self.filepath = filepath
         self.color_mode = color_mode
-        _, self.ext = os.path.splitext(filepath)
+        _, ext = os.path.splitext(filepath)
+        self.ext = ext.lower()
         super().__init__()
 
     def process(self):
         """Reads an image into an np.ndarray from .png, .jpg/.jpeg etc formats, as well as .gif format (used by some
         journals)"""
-        if self.color_mode == self.COLOR_MODE.GRAY:
+        img, img_detectron = self._read()
+        self.fig = Figure(img=img, raw_img=img, img_detectron=img_detectron)  # Important that all used imgs have bg value 0 hence raw_img==img
+        return self.fig
+
+    def _read(self):
+        """Decodes the image file and adjusts its background"""
+        # Older OpenCV builds cannot decode gifs - check the header rather than attempting to decode the file
+        if self.ext == '.gif' and not cv2.haveImageReader(self.filepath):
+            img, img_detectron = self._read_gif()
+        elif self.color_mode == self.COLOR_MODE.GRAY:
             img = cv2.imread(self.filepath, cv2.IMREAD_GRAYSCALE)
             img_detectron = cv2.imread(self.filepath)
         elif self.color_mode == self.COLOR_MODE.RGB:
-            img = cv2.imread(self.filepath, cv2.IMREAD_COLOR)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img_detectron = cv2.imread(self.filepath)
-
-        if img is None and self.ext == '.gif':   # Ensure this special case is treated
+            img_detectron = cv2.imread(self.filepath, cv2.IMREAD_COLOR)  # The BGR image is what detectron expects
+            img = cv2.cvtColor(img_detectron, cv2.COLOR_BGR2RGB) if img_detectron is not None else None
 
-            try:
-                img = imageio.mimread(self.filepath, format='gif')
-                img = img[0]
-            except ValueError:  # Binary images not handled above
-                img = Image.open(self.filepath).convert('L')
-                img = np.asarray(img)
-            img, img_detectron = self._convert_gif(img)
+        if img is None or img_detectron is None:
+            if self.ext != '.gif':
+                raise ValueError(f'Could not decode image {self.filepath}')
+            img, img_detectron = self._read_gif()  # The header was recognised, but cv2 failed to decode the file
 
         img = self.adjust_bg_value(img)
         img_detectron = self.adjust_bg_value(img_detectron, desired=255)
-        self.fig = Figure(img=img, raw_img=img, img_detectron=img_detectron)  # Important that all used imgs have bg value 0 hence raw_img==img
-        return self.fig
+        return img, img_detectron
+
+    def _read_gif(self):
+        """Reads the first frame of a gif file using imageio (or PIL for binary images)"""
+        try:
+            img = imageio.v2.imread(self.filepath, format='gif')  # Decodes the first frame only
+        except ValueError:  # Binary images not handled above
+            img = Image.open(self.filepath).convert('L')
+            img = np.asarray(img)
+        return self._convert_gif(img)
 
     def _convert_gif(self, img):
-        img_detectron = img
-        if len(img_detectron.shape) == 2:
-            img_detectron = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR )
-        elif len(img.shape) == 3 and img.shape[-1] == 4:  # RGBA
-            img_detectron = cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+        num_channels = img.shape[-1] if img.ndim == 3 else 1
+        detectron_code = self._GIF_TO_DETECTRON_CODES.get(num_channels)
+        img_detectron = cv2.cvtColor(img, detectron_code) if detectron_code is not None else img
 
-        if self.color_mode == self.COLOR_MODE.GRAY:
-            if len(img.shape) == 3 and img.shape[-1] == 4:  # RGBA
-                img = cv2.cvtColor(img, cv2.COLOR_RGBA2GRAY )
-            elif len(img.shape) == 3 and img.shape[-1] == 3:  # RGB
-                img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        elif self.color_mode == self.COLOR_MODE.RGB:
-            if len(img.shape) == 3 and img.shape[-1] == 4:  # RGBA
-                img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB )
-            elif len(img.shape) == 2:  #Gray
-                img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        code = self._GIF_CONVERSION_CODES.get((self.color_mode, num_channels))
+        if code is not None:
+            img = cv2.cvtColor(img, code)
 
         return img, img_detectron
 
@@ -107,16 +115,41 @@ class ImageReader(ImageProcessor):
         :type img: np.ndarray
         :param desired: the expected value associated with background (0 or 255)
         :type desired: int"""
-        bg_value = mode(img.ravel(), keepdims=False)[0]
+        bg_value = self._find_most_common_value(img)
 
         if desired == 0:
-            if bg_value in range(250, 256):
-                img = np.invert(img)
+            if 250 <= bg_value <= 255:
+                img = self._invert(img)
         elif desired == 255:
-            if bg_value in range(0, 10):
-                img = np.invert(img)
+            if 0 <= bg_value <= 9:
+                img = self._invert(img)
         return img
 
+    @staticmethod
+    def _invert(img):
+        """Inverts `img`. A new array is always returned - for gif files, `img` can be shared with the detectron image
+        :param img: image to be inverted
+        :type img: np.ndarray
+        :return: inverted image
+        :rtype: np.ndarray
+        """
+        if img.dtype == np.uint8:
+            return cv2.bitwise_not(img)
+        return np.invert(img)
+
+    @staticmethod
+    def _find_most_common_value(img):
+        """Finds the most common pixel value in `img`, across all channels. Ties are resolved in favour of the smaller
+        value, as in scipy.stats.mode
+        :param img: image to be processed
+        :type img: np.ndarray
+        :return: the most common value
+        """
+        if img.dtype == np.uint8:
+            return int(np.bincount(img.ravel(), minlength=256).argmax())
+        values, counts = np.unique(img, return_counts=True)
+        return values[counts.argmax()]
+
 
 class ImageScaler(ImageProcessor):
     """Processor used for scaling an image. Constant scale facilitates later processing"""
@@ -134,10 +167,13 @@ class ImageScaler(ImageProcessor):
 
     def process(self):
         """Scales an image so that the smaller dimension has the desired length (specified inside __init__)"""
-        min_dim = min(self.fig.img.shape)
-        y_dim, x_dim = self.fig.img.shape
+        y_dim, x_dim = self.fig.img.shape[:2]
+        min_dim = min(y_dim, x_dim)
         scaling_factor = self.resize_min_dim_to/min_dim
-        img = cv2.resize(self.fig.img, (int(x_dim*scaling_factor), int(y_dim*scaling_factor)))
+        # Pixel area relation gives moire-free results when shrinking, bilinear interpolation is preferred otherwise
+        interpolation = cv2.INTER_AREA if scaling_factor < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(self.fig.img, (round(x_dim*scaling_factor), round(y_dim*scaling_factor)),
+                         interpolation=interpolation)
         self.fig._scaling_factor = scaling_factor
         self.fig.img = img
         return self.fig
@@ -150,7 +186,15 @@ class ImageNormaliser(ImageProcessor):
     def process(self):
         """Normalises an image to range [0, 1]"""
         img = self.fig.img
-        img = ((img - img.min()) / (img.max() - img.min()) * 255).astype(np.uint8)
+        if img.dtype == np.uint8 and img.ndim == 2:
+            min_val, max_val, _, _ = cv2.minMaxLoc(img)
+            if min_val == 0 and max_val == 255:  # Already spans the full range
+                return self.fig
+            # Rescale with the extremes found above rather than letting cv2.normalize search for them again
+            scale = 255.0 / (max_val - min_val) if max_val > min_val else 0
+            img = cv2.convertScaleAbs(img, alpha=scale, beta=-min_val * scale)
+        else:
+            img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
         self.fig.img = img
         return self.fig
 
@@ -159,13 +203,15 @@ class Binariser(ImageProcessor):
     """Processor used for binarisation. Grayscale images are thresholed, whereas on RGB images,
     a Canny edge detector is used"""
 
-    def __init__(self, fig: 'Figure', bin_thresh: Tuple[int]=None):
+    def __init__(self, fig: 'Figure', bin_thresh: Tuple[int]=None, normalise: bool=False):
         """Init method. Input is a figure, and a pair of integers used by the thresholding algorithm
 
         :param fig: Processed Figure
         :type fig: Figure
         :param bin_thresh: a pair of integers to be used as the thresholding values by the algorithm, defaults to None
         :type bin_thresh: Tuple[int], optional
+        :param normalise: whether to normalise the image (as in ImageNormaliser) before thresholding, defaults to False
+        :type normalise: bool, optional
         """
         super().__init__(fig=fig)
         if len(self.img.shape) == 2:
@@ -173,15 +219,33 @@ class Binariser(ImageProcessor):
         elif len(self.img.shape) == 3 and self.img.dtype == np.uint8:
             self.color_mode = self.COLOR_MODE.RGB
         self.bin_thresh = bin_thresh if bin_thresh else config.ProcessorConfig.BIN_THRESH
+        self.normalise = normalise
 
     def process(self):
         """Binarises gray images"""
         if self.color_mode == self.COLOR_MODE.GRAY:
-            ret, img = cv2.threshold(self.img, *self.bin_thresh, cv2.THRESH_BINARY)
-            fig_copy = deepcopy(self.fig)
+            if self.normalise and self.img.dtype == np.uint8:
+                img = cv2.LUT(self.img, self._normalised_threshold_lut())
+            else:
+                img = self.img
+                if self.normalise:
+                    img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+                ret, img = cv2.threshold(img, *self.bin_thresh, cv2.THRESH_BINARY)
+            fig_copy = copy(self.fig)  # Shallow - all shared members other than the image are left intact
             fig_copy.img = img
             return fig_copy
 
+    def _normalised_threshold_lut(self):
+        """Builds a lookup table mapping every uint8 value onto its normalised, then thresholded value, so that both
+        steps are done in a single pass over the image. The table is normalised with the image's own min and max
+        (the mask restricts the range to them), giving the same result as ImageNormaliser followed by thresholding"""
+        min_val, max_val, _, _ = cv2.minMaxLoc(self.img)
+        lut = np.arange(256, dtype=np.uint8).reshape(1, -1)
+        mask = ((lut >= min_val) & (lut <= max_val)).astype(np.uint8)
+        lut = cv2.normalize(lut, lut.copy(), 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U, mask=mask)
+        ret, lut = cv2.threshold(lut, *self.bin_thresh, cv2.THRESH_BINARY)
+        return lut
+
 
 class Isolator(ImageProcessor):
     """Processor class used for isolating individual connected components"""
@@ -196,11 +260,14 @@ class Isolator(ImageProcessor):
 
     def _isolate_mask(self):
         rows, cols = self.to_isolate.pixels
-        mask = np.zeros_like(self.img, dtype=bool)
-        mask[rows, cols] = True
         isolated_cc_img = np.zeros_like(self.img, dtype=np.uint8)
-        isolated_cc_img[mask] = self.img[mask]
-        fig_copy = deepcopy(self.fig)
+        if self.img.ndim == 2 and self.img.flags.c_contiguous:
+            # Scatter through flat views using a single linear index per pixel
+            flat_idxs = np.ravel_multi_index((rows, cols), self.img.shape)
+            isolated_cc_img.ravel()[flat_idxs] = self.img.ravel()[flat_idxs]
+        else:
+            isolated_cc_img[rows, cols] = self.img[rows, cols]
+        fig_copy = copy(self.fig)
         fig_copy.img = isolated_cc_img
         return fig_copy
 
@@ -11,17 +11,20 @@ from __future__ import division
 
 from collections.abc import Container
 import copy
+import math
 import numpy as np
 from typing import List
 
 import cv2
 from scipy import ndimage as ndi
-from scipy.stats import mode
 
 from reactiondataextractor.configs import config
 from reactiondataextractor.models.geometry import Line, Point, OpencvToSkimageHoughLineAdapter
 from reactiondataextractor.models.segments import Rect, Panel, Figure, FigureRoleEnum
 
+_DILATION_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+
 class DisabledNegativeIndices:
     """If a negative index is passed to an underlying sequence, then an empty element of appropriate type is returned.
     Slices including negative start indices are corrected to start at 0
@@ -189,8 +192,7 @@ def dilate_fig(fig, num_iterations):
     :param int num_iterations: number of iterations for dilation
     :return Figure: new Figure object
     """
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    f = cv2.dilate(fig.img, kernel, iterations=int(num_iterations))
+    f = cv2.dilate(fig.img, _DILATION_KERNEL, iterations=int(num_iterations))
     f = Figure(f, raw_img=fig.raw_img)
     return f
 
@@ -384,8 +386,10 @@ def skeletonize_area_ratio(fig, panel):
 def mark_tiny_ccs(fig):
     """Marks all tiny connected components
     :param Figure fig: Analysed figure"""
-    [setattr(cc, 'role', FigureRoleEnum.TINY) for cc in fig.connected_components if
-     cc.area < np.percentile([cc.area for cc in fig.connected_components], 4) and cc.role is None]
+    area_thresh = np.percentile([cc.area for cc in fig.connected_components], 4)
+    for cc in fig.connected_components:
+        if cc.area < area_thresh and cc.role is None:
+            cc.role = FigureRoleEnum.TINY
 
 
 def find_relative_directional_position(point1, point2):
@@ -422,33 +426,12 @@ def lies_along_arrow_normal(arrow, obj):
     arrow's bounding box (minimal), and check which is closest. Reclassify as conditions if obj is closer to
     a normal point"""
 
-    # (x, y), (MA, ma), angle = cv2.minAreaRect(arrow.contour)
-    min_rect = cv2.minAreaRect(arrow.contour[0])
-    box_points = cv2.boxPoints(min_rect)
-    diffs = [box_points[idx+1] - box_points[idx] for idx in range(3)] + [box_points[0] - box_points[-1]]
-    box_segment_lengths = [np.sqrt(np.sum(np.power(x,2))) for x in diffs]
-    largest_idx = np.argmax(box_segment_lengths)
-    points = box_points[largest_idx], box_points[(largest_idx+1)%4]
-    x_diff = points[1][0] - points[0][0]
-    y_diff = points[1][1] - points[0][1]
-    eps  = 1e-5
-    dir_array = np.array([x_diff, y_diff])
-    direction_arrow = dir_array / np.linalg.norm(dir_array)
-
+    direction_arrow, direction_normal = arrow.direction, arrow.direction_normal
     center = np.asarray(arrow.panel.center)
-    direction_normal = np.asarray([-1*direction_arrow[1], direction_arrow[0]])
-    dist = box_segment_lengths[largest_idx] / 2
+    dist = arrow.major_axis_length / 2
     p_a1, p_a2 = find_points_on_line(center, direction_arrow, distance=dist * 1.5)
     p_n1, p_n2 = find_points_on_line(center, direction_normal, distance=dist * .5)
     closest_pt = min([p_a1, p_a2, p_n1, p_n2], key=lambda pt: obj.center_separation(pt))
-    ## Visualize created points
-    # import matplotlib.pyplot as plt
-    # plt.imshow(self.fig.img)
-    # plt.scatter(p_a1[0], p_a1[1], c='r', s=3)
-    # plt.scatter(p_a2[0], p_a2[1], c='r', s=3)
-    # plt.scatter(p_n1[0], p_n1[1], c='b', s=3)
-    # plt.scatter(p_n2[0], p_n2[1], c='b', s=3)
-    # plt.show()
 
     if any(np.array_equal(closest_pt, p) for p in [p_n1, p_n2]):
         return True
@@ -472,4 +455,4 @@ def compute_ioa(panel1, panel2):
 
 
 def euclidean_distance(p1, p2):
-    return np.sqrt(np.sum([(x2-x1)**2 for x1, x2 in zip(p1, p2)]))
+    return math.hypot(*(x2-x1 for x1, x2 in zip(p1, p2)))